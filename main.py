@@ -1,6 +1,9 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 import plotly.express as px
+import plotly.io as pio
+import hashlib
 from datetime import datetime
 
 # Konfigurasi halaman Streamlit
@@ -12,11 +15,20 @@ st.markdown("Unggah file **CSV** atau **XLSX** data pelanggan Anda untuk mendapa
 
 # --- FUNGSI-FUNGSI UTAMA ---
 
-@st.cache_data
+def file_fingerprint(uploaded_file):
+    """
+    Sidik jari isi file untuk kunci cache `load_data` dan fungsi analisis yang di-cache.
+    Membaca buffer file secara langsung (tanpa menyalin seluruh isi file seperti hasher bawaan Streamlit).
+    """
+    with uploaded_file.getbuffer() as buffer:
+        return uploaded_file.name, hashlib.blake2b(buffer, digest_size=16).hexdigest()
+
+@st.cache_resource(hash_funcs={"streamlit.runtime.uploaded_file_manager.UploadedFile": file_fingerprint})
 def load_data(uploaded_file):
     """
     Fungsi cerdas untuk memuat data dari file CSV atau XLSX.
     Secara otomatis menstandardisasi nama kolom.
+    DataFrame hasil cache dipakai bersama antar-rerun tanpa pickle ulang, jadi jangan diubah di tempat.
     """
     df = None
     file_extension = uploaded_file.name.split('.')[-1].lower()
@@ -31,8 +43,8 @@ def load_data(uploaded_file):
                 df = pd.read_csv(uploaded_file, sep=';', on_bad_lines='skip', encoding='utf-8')
         
         elif file_extension in ['xlsx', 'xls']:
-            # Logika untuk membaca file Excel
-            df = pd.read_excel(uploaded_file, engine='openpyxl')
+            # Logika untuk membaca file Excel (engine calamine berbasis Rust, jauh lebih cepat dari openpyxl)
+            df = pd.read_excel(uploaded_file, engine='calamine')
         
         else:
             st.error("Format file tidak didukung. Harap unggah file CSV atau XLSX.")
@@ -49,30 +61,56 @@ def load_data(uploaded_file):
         st.sidebar.subheader("Nama Kolom Terdeteksi:")
         st.sidebar.code(df.columns.tolist())
 
-        date_cols = ['dob', 'join_date', 'first_transaction_date', 'last_transaction_date']
+        # Hanya simpan kolom yang dipakai dashboard, agar konversi tipe dan agregasi tidak membawa kolom lain
+        used_cols = ['member_code', 'lifetime_transaction', 'lifetime_spend', 'member_status', 'gender', 'dob',
+                     'join_date', 'last_transaction_date', 'favorite_menu', 'favorite_branch']
+        df = df[[col for col in used_cols if col in df.columns]]
+
+        date_cols = ['dob', 'join_date', 'last_transaction_date']
         for col in date_cols:
             if col in df.columns:
                 df[col] = pd.to_datetime(df[col], errors='coerce')
 
-        for col in df.select_dtypes(include=['float64', 'int64']).columns:
-            df[col].fillna(0, inplace=True)
-        for col in df.select_dtypes(include=['object']).columns:
-            df[col].fillna('Unknown', inplace=True)
+        # Isi nilai kosong semua kolom dalam satu kali fillna (angka -> 0, teks -> 'Unknown')
+        fill_values = dict.fromkeys(df.select_dtypes(include=['float64', 'int64']).columns, 0)
+        fill_values.update(dict.fromkeys(df.select_dtypes(include=['object']).columns, 'Unknown'))
+        df = df.fillna(fill_values)
+
+        # Kolom bilangan bulat diperkecil ke int32 bila rentangnya cukup (setengah memori, sum tetap int64).
+        # Kolom uang (lifetime_spend) sengaja dilewati dan tetap 64-bit (int64/float64 sesuai isi file).
+        money_cols = ['lifetime_spend']
+        int32_range = np.iinfo(np.int32)
+        int_cols = [col for col in df.select_dtypes(include=['int64']).columns
+                    if col not in money_cols and df[col].between(int32_range.min, int32_range.max).all()]
+        df = df.astype(dict.fromkeys(int_cols, 'int32'))
+
+        # Kolom teks dengan sedikit nilai unik disimpan sebagai category,
+        # sehingga perbandingan dan groupby cukup memakai kode integer
+        category_cols = ['gender', 'member_status', 'favorite_menu', 'favorite_branch']
+        df = df.astype({col: 'category' for col in category_cols if col in df.columns})
+
+        # Sisa kolom teks (mis. member_code) memakai string berbasis Arrow agar groupby/nunique berjalan di kernel C++
+        df = df.astype(dict.fromkeys(df.select_dtypes(include=['object']).columns, 'string[pyarrow]'))
             
         return df
     return None
 
-def calculate_rfm(df):
-    """Fungsi untuk menghitung Recency, Frequency, Monetary dan membuat segmentasi."""
+@st.cache_data
+def calculate_rfm(_df, file_key):
+    """
+    Fungsi untuk menghitung Recency, Frequency, Monetary dan membuat segmentasi.
+    Hasilnya disimpan di cache dengan kunci `file_key` (sidik jari file), bukan hash DataFrame
+    yang hanya mengambil sampel baris pada data besar; `_df` tidak di-hash oleh Streamlit.
+    """
     required_cols = ['last_transaction_date', 'lifetime_transaction', 'lifetime_spend', 'member_code']
-    if not all(col in df.columns for col in required_cols):
+    if not all(col in _df.columns for col in required_cols):
         st.warning(f"Kolom yang dibutuhkan untuk Analisis RFM tidak ditemukan. Dibutuhkan: {', '.join(required_cols)}")
         return None
 
-    snapshot_date = df['last_transaction_date'].max() + pd.Timedelta(days=1)
+    snapshot_date = _df['last_transaction_date'].max() + pd.Timedelta(days=1)
     
-    rfm = df.groupby('member_code').agg({
-        'last_transaction_date': lambda date: (snapshot_date - date.max()).days,
+    rfm = _df.groupby('member_code').agg({
+        'last_transaction_date': 'max',
         'lifetime_transaction': 'sum',
         'lifetime_spend': 'sum'
     }).rename(columns={
@@ -80,6 +118,8 @@ def calculate_rfm(df):
         'lifetime_transaction': 'Frequency',
         'lifetime_spend': 'Monetary'
     })
+    # Recency dihitung sekali untuk semua member, bukan lewat lambda per grup
+    rfm['Recency'] = (snapshot_date - rfm['Recency']).dt.days
 
     rfm['R_Score'] = pd.qcut(rfm['Recency'], 4, labels=[4, 3, 2, 1], duplicates='drop')
     rfm['F_Score'] = pd.qcut(rfm['Frequency'].rank(method='first'), 4, labels=[1, 2, 3, 4], duplicates='drop')
@@ -94,9 +134,85 @@ def calculate_rfm(df):
         r'[2-3][1-2][1-2]': 'About to Sleep', r'[1][2-4][2-4]': '😥 At Risk',
         r'[1][1][1-4]': 'Hibernating', r'[1-2][1-2][1-2]': '💔 Lost'
     }
-    rfm['Segment'] = rfm['RFM_Score'].replace(segment_map, regex=True)
+    # Aturan segmen cukup dievaluasi sekali untuk ke-64 kombinasi skor (4x4x4),
+    # lalu hasilnya dipetakan ke semua member; skor di luar aturan tetap ditampilkan apa adanya
+    score_codes = [f"{r}{f}{m}" for r in range(1, 5) for f in range(1, 5) for m in range(1, 5)]
+    segment_lookup = pd.Series(score_codes, index=score_codes).replace(segment_map, regex=True)
+    rfm['Segment'] = rfm['RFM_Score'].map(segment_lookup).fillna(rfm['RFM_Score'])
     return rfm
 
+@st.cache_data(ttl="1d")
+def calculate_age_spend(_dob, _lifetime_spend, file_key):
+    """
+    Fungsi untuk menghitung umur pelanggan dan total belanja per kelompok umur.
+    Hasilnya disimpan di cache dengan kunci `file_key` (kedaluwarsa setiap hari agar umur tetap akurat);
+    Series `_dob` dan `_lifetime_spend` tidak di-hash oleh Streamlit.
+    """
+    # --- PERBAIKAN DI SINI ---
+    # Hitung selisih hari langsung dari nilai int64 (nanodetik) tanpa membuat Series timedelta.
+    # 'dob' yang kosong/invalid (NaT) ditandai tidak valid
+    dob_values = _dob.to_numpy(dtype='datetime64[ns]')
+    valid = ~np.isnat(dob_values)
+    now_ns = np.datetime64(datetime.now(), 'ns').astype(np.int64)
+    age_days = (now_ns - dob_values.view(np.int64)) // (24 * 60 * 60 * 10**9)
+
+    # Konversi ke tahun. Bagi dengan 365.25 untuk akurasi. 
+    # Pembagian hanya dilakukan untuk umur yang valid; umur yang tidak bisa dihitung langsung bernilai 0
+    # Lalu konversi semua umur menjadi angka bulat (integer)
+    age_float = np.divide(age_days, 365.25, out=np.zeros(len(dob_values)), where=valid)
+    age = pd.Series(age_float.astype(int), index=_dob.index)
+    # --- AKHIR PERBAIKAN ---
+
+    # Buat Kelompok Umur
+    bins = [0, 17, 24, 34, 44, 54, 64, 150] # Batas atas dinaikkan
+    labels = ['<18', '18-24', '25-34', '35-44', '45-54', '55-64', '65+']
+    age_group = pd.cut(age, bins=bins, labels=labels, right=False).rename('age_group')
+
+    # Baris dengan age_group kosong otomatis diabaikan oleh groupby
+    return _lifetime_spend.groupby(age_group, observed=False).sum().reset_index()
+
+@st.cache_data
+def build_acquisition_fig(monthly_joins):
+    """
+    Membangun grafik pertumbuhan member baru dan mengembalikannya dalam bentuk JSON.
+    Hasil serialisasi disimpan di cache sehingga rerun dengan data yang sama tidak perlu membangun ulang grafik.
+    """
+    fig_join = px.line(monthly_joins, x=monthly_joins.index, y=monthly_joins.values, title="Pertumbuhan Member Baru per Bulan", labels={'x': 'Bulan', 'y': 'Jumlah Member Baru'})
+    return fig_join.to_json()
+
+@st.cache_data
+def build_top10_fig(_values, file_key, title, y_label):
+    """
+    Menghitung 10 nilai terbanyak dari sebuah kolom dan membangun grafik batangnya dalam bentuk JSON.
+    Agregasi dan grafik disimpan di cache dengan kunci `file_key` dan judul grafik; kolom `_values` tidak di-hash.
+    Jumlah yang sama diurutkan menurut kemunculan pertama di data (bukan urutan category),
+    agar isi dan urutan grafik pada batas peringkat ke-10 selalu sama untuk file yang sama.
+    """
+    counts = _values.value_counts(sort=False).reindex(_values.unique())
+    top10 = counts.sort_values(ascending=False, kind='stable').head(10)
+    fig = px.bar(top10, x=top10.values, y=top10.index, orientation='h', title=title, labels={'x': 'Jumlah Pelanggan', 'y': y_label})
+    fig.update_layout(yaxis={'categoryorder':'total ascending'})
+    return fig.to_json()
+
+@st.cache_data
+def build_pie_fig(counts, title):
+    """Membangun grafik pie dari hasil hitungan per kategori dan mengembalikannya dalam bentuk JSON (disimpan di cache)."""
+    fig = px.pie(counts, values=counts.values, names=counts.index, title=title)
+    return fig.to_json()
+
+@st.cache_data
+def build_spend_bar_fig(spend, x, title):
+    """Membangun grafik batang total belanja per kelompok dan mengembalikannya dalam bentuk JSON (disimpan di cache)."""
+    fig = px.bar(spend, x=x, y='lifetime_spend', title=title)
+    return fig.to_json()
+
+@st.cache_data
+def build_segment_fig(segment_counts):
+    """Membangun grafik distribusi segmen RFM dan mengembalikannya dalam bentuk JSON (disimpan di cache)."""
+    fig_rfm = px.bar(segment_counts, x=segment_counts.index, y=segment_counts.values, title="Distribusi Pelanggan Berdasarkan Segmen RFM", labels={'x': 'Segmen', 'y': 'Jumlah Pelanggan'})
+    fig_rfm.update_layout(xaxis={'categoryorder':'total descending'})
+    return fig_rfm.to_json()
+
 # --- SIDEBAR UNTUK UPLOAD FILE ---
 with st.sidebar:
     st.header("⚙️ Pengaturan")
@@ -105,8 +221,12 @@ with st.sidebar:
 # --- KONTEN UTAMA APLIKASI ---
 if uploaded_file is not None:
     df = load_data(uploaded_file)
+    file_key = file_fingerprint(uploaded_file)
     
     if df is not None:
+        # Ringkasan per gender dihitung sekali dan dipakai bersama oleh tab Ringkasan Umum dan Demografi
+        gender_summary = df.groupby('gender', observed=True)['lifetime_spend'].agg(['size', 'sum'])
+
         tab1, tab2, tab3, tab4, tab5 = st.tabs([
             "📊 Ringkasan Umum", "👑 Segmentasi RFM", "🎂 Demografi Pelanggan",
             "🍝 Produk & Cabang", "📈 Akuisisi Member"
@@ -115,34 +235,33 @@ if uploaded_file is not None:
         with tab1:
             st.header("Ringkasan Umum Bisnis")
             # ... (kode di tab ini tidak berubah) ...
+            status_counts = df['member_status'].value_counts()
             col1, col2, col3, col4 = st.columns(4)
             col1.metric("Total Pelanggan", f"{df['member_code'].nunique():,}")
             col2.metric("Total Transaksi", f"{df['lifetime_transaction'].sum():,}")
             col3.metric("Total Pendapatan", f"Rp {df['lifetime_spend'].sum():,}")
-            col4.metric("Status Member Aktif", f"{df[df['member_status'] == 'Active'].shape[0]:,}")
+            col4.metric("Status Member Aktif", f"{status_counts.get('Active', 0):,}")
             st.markdown("---")
             c1, c2 = st.columns(2)
             with c1:
                 st.subheader("Distribusi Status Member")
-                status_counts = df['member_status'].value_counts()
-                fig_status = px.pie(status_counts, values=status_counts.values, names=status_counts.index, title="Proporsi Member Aktif vs Inaktif")
+                fig_status = pio.from_json(build_pie_fig(status_counts, "Proporsi Member Aktif vs Inaktif"))
                 st.plotly_chart(fig_status, use_container_width=True)
             with c2:
                 st.subheader("Distribusi Gender")
-                gender_counts = df['gender'].value_counts()
-                fig_gender = px.pie(gender_counts, values=gender_counts.values, names=gender_counts.index, title="Proporsi Gender Pelanggan")
+                gender_counts = gender_summary['size'].sort_values(ascending=False, kind='stable')
+                fig_gender = pio.from_json(build_pie_fig(gender_counts, "Proporsi Gender Pelanggan"))
                 st.plotly_chart(fig_gender, use_container_width=True)
 
         with tab2:
             st.header("👑 Segmentasi Pelanggan (RFM Analysis)")
             # ... (kode di tab ini tidak berubah) ...
             st.markdown("RFM adalah metode segmentasi berdasarkan Recency, Frequency, dan Monetary.")
-            rfm_df = calculate_rfm(df)
+            rfm_df = calculate_rfm(df, file_key)
             if rfm_df is not None:
                 segment_counts = rfm_df['Segment'].value_counts()
                 st.subheader("Jumlah Pelanggan per Segmen")
-                fig_rfm = px.bar(segment_counts, x=segment_counts.index, y=segment_counts.values, title="Distribusi Pelanggan Berdasarkan Segmen RFM", labels={'x': 'Segmen', 'y': 'Jumlah Pelanggan'})
-                fig_rfm.update_layout(xaxis={'categoryorder':'total descending'})
+                fig_rfm = pio.from_json(build_segment_fig(segment_counts))
                 st.plotly_chart(fig_rfm, use_container_width=True)
                 st.subheader("Detail Data per Segmen")
                 st.dataframe(rfm_df.sort_values(by='Monetary', ascending=False))
@@ -151,36 +270,17 @@ if uploaded_file is not None:
             st.header("🎂 Analisis Demografi Pelanggan")
             if 'dob' in df.columns:
                 
-                # --- PERBAIKAN DI SINI ---
                 st.subheader("Perhitungan Umur (Age Calculation)")
-                # Hitung selisih waktu. Hasilnya akan mengandung NaT jika 'dob' kosong/invalid
-                time_diff = datetime.now() - df['dob']
-
-                # Konversi ke tahun. Bagi dengan 365.25 untuk akurasi. 
-                # NaT akan otomatis menjadi NaN (Not a Number) yang bisa di-handle
-                age_float = time_diff.dt.days / 365.25
-
-                # Ganti nilai NaN (umur yang tidak bisa dihitung) dengan 0 atau nilai lain
-                # Lalu konversi semua umur menjadi angka bulat (integer)
-                df['age'] = age_float.fillna(0).astype(int)
-                # --- AKHIR PERBAIKAN ---
-
-                # Buat Kelompok Umur
-                bins = [0, 17, 24, 34, 44, 54, 64, 150] # Batas atas dinaikkan
-                labels = ['<18', '18-24', '25-34', '35-44', '45-54', '55-64', '65+']
-                df['age_group'] = pd.cut(df['age'], bins=bins, labels=labels, right=False)
-                
                 c1, c2 = st.columns(2)
                 with c1:
                     st.subheader("Total Belanja Berdasarkan Kelompok Umur")
-                    # Filter data dimana age_group tidak kosong
-                    age_spend = df[df['age_group'].notna()].groupby('age_group')['lifetime_spend'].sum().reset_index()
-                    fig_age = px.bar(age_spend, x='age_group', y='lifetime_spend', title="Total Belanja vs Kelompok Umur")
+                    age_spend = calculate_age_spend(df['dob'], df['lifetime_spend'], file_key)
+                    fig_age = pio.from_json(build_spend_bar_fig(age_spend, 'age_group', "Total Belanja vs Kelompok Umur"))
                     st.plotly_chart(fig_age, use_container_width=True)
                 with c2:
                     st.subheader("Total Belanja Berdasarkan Gender")
-                    gender_spend = df.groupby('gender')['lifetime_spend'].sum().reset_index()
-                    fig_gender_spend = px.bar(gender_spend, x='gender', y='lifetime_spend', title="Total Belanja vs Gender")
+                    gender_spend = gender_summary['sum'].rename('lifetime_spend').reset_index()
+                    fig_gender_spend = pio.from_json(build_spend_bar_fig(gender_spend, 'gender', "Total Belanja vs Gender"))
                     st.plotly_chart(fig_gender_spend, use_container_width=True)
             else:
                 st.warning("Kolom 'dob' tidak ditemukan untuk analisis demografi.")
@@ -190,23 +290,18 @@ if uploaded_file is not None:
             c1, c2 = st.columns(2)
             with c1:
                 st.subheader("10 Menu Terfavorit")
-                fav_menu = df['favorite_menu'].value_counts().nlargest(10)
-                fig_menu = px.bar(fav_menu, x=fav_menu.values, y=fav_menu.index, orientation='h', title="Top 10 Menu Favorit", labels={'x': 'Jumlah Pelanggan', 'y': 'Menu'})
-                fig_menu.update_layout(yaxis={'categoryorder':'total ascending'})
+                fig_menu = pio.from_json(build_top10_fig(df['favorite_menu'], file_key, "Top 10 Menu Favorit", 'Menu'))
                 st.plotly_chart(fig_menu, use_container_width=True)
             with c2:
                 st.subheader("10 Cabang Terfavorit")
-                fav_branch = df['favorite_branch'].value_counts().nlargest(10)
-                fig_branch = px.bar(fav_branch, x=fav_branch.values, y=fav_branch.index, orientation='h', title="Top 10 Cabang Favorit", labels={'x': 'Jumlah Pelanggan', 'y': 'Cabang'})
-                fig_branch.update_layout(yaxis={'categoryorder':'total ascending'})
+                fig_branch = pio.from_json(build_top10_fig(df['favorite_branch'], file_key, "Top 10 Cabang Favorit", 'Cabang'))
                 st.plotly_chart(fig_branch, use_container_width=True)
         
         with tab5:
             st.header("📈 Analisis Akuisisi dan Pertumbuhan Member")
             if 'join_date' in df.columns:
-                df_join = df.set_index('join_date')
-                monthly_joins = df_join.resample('M').size().rename('Jumlah Member Baru')
-                fig_join = px.line(monthly_joins, x=monthly_joins.index, y=monthly_joins.values, title="Pertumbuhan Member Baru per Bulan", labels={'x': 'Bulan', 'y': 'Jumlah Member Baru'})
+                monthly_joins = df.resample('M', on='join_date').size().rename('Jumlah Member Baru')
+                fig_join = pio.from_json(build_acquisition_fig(monthly_joins))
                 st.plotly_chart(fig_join, use_container_width=True)
             else:
                 st.warning("Kolom 'join_date' tidak ditemukan untuk analisis akuisisi.")